@@ -24,15 +24,56 @@ import tensorflow as tf
 
 from dnc import addressing, util
 
+try:
+    from dnc import numba_step
+except ImportError:  # Numba is optional, and only needed by `numba=True`.
+    numba_step = None
+
 # For indexing directly into MemoryAccess state
 MEMORY = 0
 READ_WEIGHTS = 1
 WRITE_WEIGHTS = 2
 LINKAGE = 3
 USAGE = 4
+# Only present with `quantize_memory=True`.
+MEMORY_SCALE = 5
+
+
+def _einsum(equation, a, b, compute_dtype=None):
+    """Returns `tf.einsum(equation, a, b)`, optionally computed in `compute_dtype`.
+
+    The inputs are cast to `compute_dtype` (e.g. `tf.bfloat16` to run on tensor
+    cores) and the product is cast back to the dtype of `a`.
+    """
+    if compute_dtype is None or compute_dtype == a.dtype:
+        return tf.einsum(equation, a, b)
+    product = tf.einsum(equation, tf.cast(a, compute_dtype), tf.cast(b, compute_dtype))
+    return tf.cast(product, a.dtype)
 
 
-def _erase_and_write(memory, address, reset_weights, values):
+def _quantize(memory):
+    """Returns `(quantized, scale)`, storing `memory` as int8 with a scale per slot.
+
+    Args:
+      memory: 3-D tensor of shape `[batch_size, memory_size, word_size]`.
+
+    Returns:
+      A tuple of an int8 tensor of the same shape as `memory`, and a tensor of
+      shape `[batch_size, memory_size]` such that the quantized memory times the
+      scale approximates `memory`.
+    """
+    scale = tf.reduce_max(tf.abs(memory), axis=-1) / 127
+    quantized = tf.round(tf.math.divide_no_nan(memory, scale[:, :, None]))
+    return tf.cast(tf.clip_by_value(quantized, -127, 127), tf.int8), scale
+
+
+def _dequantize(quantized, scale):
+    """Inverts `_quantize`, returning memory in the dtype of `scale`."""
+    return tf.cast(quantized, scale.dtype) * scale[:, :, None]
+
+
+@tf.function(jit_compile=True)
+def _erase_and_write(memory, address, reset_weights, values, compute_dtype=None):
     """Module to erase and write in the external memory.
 
     Erase operation:
@@ -43,14 +84,18 @@ def _erase_and_write(memory, address, reset_weights, values):
 
     where e are the reset_weights, w the write weights and a the values.
 
+    The erase and add operations are compiled together with XLA so that the
+    elementwise chain is fused into a single pass over `memory`.
+
     Args:
       memory: 3-D tensor of shape `[batch_size, memory_size, word_size]`.
       address: 3-D tensor `[batch_size, num_writes, memory_size]`.
       reset_weights: 3-D tensor `[batch_size, num_writes, word_size]`.
       values: 3-D tensor `[batch_size, num_writes, word_size]`.
+      compute_dtype: optional dtype in which to compute the add matrix.
 
     Returns:
-      3-D tensor of shape `[batch_size, num_writes, word_size]`.
+      3-D tensor of shape `[batch_size, memory_size, word_size]`.
     """
     expand_address = tf.expand_dims(address, 3)
     reset_weights = tf.expand_dims(reset_weights, 2)
@@ -58,12 +103,25 @@ def _erase_and_write(memory, address, reset_weights, values):
     reset_gate = util.reduce_prod(1 - weighted_resets, 1)
     memory *= reset_gate
 
-    add_matrix = tf.matmul(address, values, adjoint_a=True)
+    add_matrix = _einsum("bwm,bwd->bmd", address, values, compute_dtype)
     memory += add_matrix
 
     return memory
 
 
+@tf.function(jit_compile=True)
+def _erase_and_write_single(memory, address, reset_weights, values, compute_dtype=None):
+    """Specialization of `_erase_and_write` for a single write head.
+
+    There is no `num_writes` axis to reduce over, so the erase and add operations
+    are plain outer products. `compute_dtype` is accepted for compatibility but
+    unused, as no matmul is involved.
+    """
+    expand_address = address[:, 0, :, None]
+    reset_gate = 1 - expand_address * reset_weights[:, 0, None, :]
+    return memory * reset_gate + expand_address * values[:, 0, None, :]
+
+
 class MemoryAccess(snt.RNNCore):
     """Access module of the Differentiable Neural Computer.
 
@@ -90,6 +148,10 @@ class MemoryAccess(snt.RNNCore):
         num_writes=1,
         name="memory_access",
         dtype=tf.float32,
+        compute_dtype=None,
+        link_top_k=None,
+        numba=False,
+        quantize_memory=False,
     ):
         """Creates a MemoryAccess module.
 
@@ -99,6 +161,24 @@ class MemoryAccess(snt.RNNCore):
           num_reads: The number of read heads (R in the DNC paper).
           num_writes: The number of write heads (fixed at 1 in the paper).
           name: The name of the module.
+          dtype: The dtype of the memory access state.
+          compute_dtype: Optional dtype (e.g. `tf.bfloat16`) in which to compute
+              the memory write and read matmuls. Results are cast back to
+              `dtype`, so the state keeps its precision.
+          link_top_k: Optional number of entries per row to keep when storing the
+              temporal link graphs sparsely (see `addressing.TemporalLinkage`).
+          numba: Whether to compute the memory access step on the CPU with the
+              Numba kernel in `numba_step`. This is intended for inference and
+              is not differentiable.
+          quantize_memory: Whether to store the memory in the state as int8, with
+              a scale per memory slot in an extra `MEMORY_SCALE` state. This
+              cuts the memory footprint by 4x for large `memory_size`, but is
+              lossy and not differentiable, so it is intended for inference.
+
+        Raises:
+          ImportError: if `numba` is set but Numba is not installed.
+          ValueError: if `numba` is set together with a sparse link or
+              `quantize_memory`.
         """
         super(MemoryAccess, self).__init__(name=name)
         self._memory_size = memory_size
@@ -107,6 +187,14 @@ class MemoryAccess(snt.RNNCore):
         self._num_writes = num_writes
 
         self._dtype = dtype
+        self._compute_dtype = compute_dtype
+
+        # The paper (and default config) uses one write head, for which the
+        # `num_writes` axis can be dropped from the memory update.
+        if num_writes == 1:
+            self._erase_and_write = _erase_and_write_single
+        else:
+            self._erase_and_write = _erase_and_write
 
         self._write_content_weights_mod = addressing.CosineWeights(
             num_writes, word_size, name="write_content_weights"
@@ -115,10 +203,23 @@ class MemoryAccess(snt.RNNCore):
             num_reads, word_size, name="read_content_weights"
         )
 
-        self._linkage = addressing.TemporalLinkage(memory_size, num_writes, dtype=dtype)
+        self._linkage = addressing.TemporalLinkage(
+            memory_size, num_writes, dtype=dtype, link_top_k=link_top_k
+        )
         self._freeness = addressing.Freeness(memory_size, dtype=dtype)
 
-        self._linear_layers = {}
+        self._interface_linear = None
+        self._initial_state_cache = {}
+
+        self._numba = numba
+        if numba and numba_step is None:
+            raise ImportError("MemoryAccess(numba=True) requires numba.")
+        if numba and link_top_k is not None and link_top_k < memory_size:
+            raise ValueError("MemoryAccess(numba=True) requires a dense link.")
+
+        self._quantize_memory = quantize_memory
+        if numba and quantize_memory:
+            raise ValueError("MemoryAccess(numba=True) cannot quantize memory.")
 
     # keras.layers.RNN abstract method
     def call(self, inputs, prev_state):
@@ -138,13 +239,22 @@ class MemoryAccess(snt.RNNCore):
           `[batch_size, num_reads, word_size]`, and `next_state` is the new
           nested list of tensors at the current time t.
         """
+        if self._numba:
+            return self._numba_step(inputs, prev_state)
+        return self._step(inputs, prev_state)
+
+    @tf.function(jit_compile=True, reduce_retracing=True)
+    def _step(self, inputs, prev_state):
+        """Computes `__call__` as a single XLA-compiled step."""
         (
             prev_memory,
             prev_read_weights,
             prev_write_weights,
             prev_linkage,
             prev_usage,
-        ) = prev_state
+        ) = prev_state[:5]
+        if self._quantize_memory:
+            prev_memory = _dequantize(prev_memory, prev_state[MEMORY_SCALE])
 
         inputs = self._read_inputs(inputs)
 
@@ -158,11 +268,12 @@ class MemoryAccess(snt.RNNCore):
 
         # Write to memory.
         write_weights = self._write_weights(inputs, prev_memory, usage)
-        memory = _erase_and_write(
+        memory = self._erase_and_write(
             prev_memory,
             address=write_weights,
             reset_weights=inputs["erase_vectors"],
             values=inputs["write_vectors"],
+            compute_dtype=self._compute_dtype,
         )
 
         [link, precedence_weights] = self._linkage(write_weights, prev_linkage)
@@ -171,7 +282,46 @@ class MemoryAccess(snt.RNNCore):
         read_weights = self._read_weights(
             inputs, memory=memory, prev_read_weights=prev_read_weights, link=link
         )
-        read_words = tf.matmul(read_weights, memory)
+        read_words = _einsum("brm,bmd->brd", read_weights, memory, self._compute_dtype)
+
+        state = [memory, read_weights, write_weights, [link, precedence_weights], usage]
+        if self._quantize_memory:
+            state[MEMORY], memory_scale = _quantize(memory)
+            state.append(memory_scale)
+        return read_words, state
+
+    def _numba_step(self, inputs, prev_state):
+        """Computes `__call__` with `numba_step.access_step` on the CPU."""
+        (
+            prev_memory,
+            prev_read_weights,
+            prev_write_weights,
+            [prev_link, prev_precedence_weights],
+            prev_usage,
+        ) = prev_state
+        prev_state = [
+            prev_memory,
+            prev_read_weights,
+            prev_write_weights,
+            prev_link,
+            prev_precedence_weights,
+            prev_usage,
+        ]
+
+        inputs = self._read_inputs(inputs)
+        controls = [inputs[name] for name in numba_step.CONTROLS]
+
+        read_words, *state = tf.numpy_function(
+            numba_step.access_step,
+            prev_state + controls,
+            Tout=[self._dtype] * (1 + len(prev_state)),
+            stateful=False,
+        )
+        # The state keeps its shapes, which are lost by `tf.numpy_function`.
+        read_words.set_shape(prev_read_weights.shape[:2].concatenate([self._word_size]))
+        for tensor, prev_tensor in zip(state, prev_state):
+            tensor.set_shape(prev_tensor.shape)
+        memory, read_weights, write_weights, link, precedence_weights, usage = state
 
         return (
             read_words,
@@ -180,65 +330,49 @@ class MemoryAccess(snt.RNNCore):
 
     def _read_inputs(self, inputs):
         """Applies transformations to `inputs` to get control for this module."""
-
-        def _linear(dims, name, activation=None):
-            """Returns a linear transformation of `inputs`, followed by a reshape."""
-            linear = self._linear_layers.get(name)
-            if not linear:
-                linear = snt.Linear(np.prod(dims), name=name)
-                self._linear_layers[name] = linear
-
-            linear = linear(inputs)
-            if activation is not None:
-                linear = activation(linear, name=name + "_activation")
-            return tf.reshape(linear, [-1, *dims])
-
-        # v_t^i - The vectors to write to memory, for each write head `i`.
-        write_vectors = _linear([self._num_writes, self._word_size], "write_vectors")
-
-        # e_t^i - Amount to erase the memory by before writing, for each write head.
-        erase_vectors = _linear(
-            [self._num_writes, self._word_size], "erase_vectors", tf.sigmoid
-        )
-
-        # f_t^j - Amount that the memory at the locations read from at the previous
-        # time step can be declared unused, for each read head `j`.
-        free_gate = _linear([self._num_reads], "free_gate", tf.sigmoid)
-
-        # g_t^{a, i} - Interpolation between writing to unallocated memory and
-        # content-based lookup, for each write head `i`. Note: `a` is simply used to
-        # identify this gate with allocation vs writing (as defined below).
-        allocation_gate = _linear([self._num_writes], "allocation_gate", tf.sigmoid)
-
-        # g_t^{w, i} - Overall gating of write amount for each write head.
-        write_gate = _linear([self._num_writes], "write_gate", tf.sigmoid)
-
-        # \pi_t^j - Mixing between "backwards" and "forwards" positions (for
-        # each write head), and content-based lookup, for each read head.
         num_read_modes = 1 + 2 * self._num_writes
-        read_mode = snt.BatchApply(tf.nn.softmax)(
-            _linear([self._num_reads, num_read_modes], name="read_mode")
-        )
-
-        # Parameters for the (read / write) "weights by content matching" modules.
-        write_keys = _linear([self._num_writes, self._word_size], "write_keys")
-        write_strengths = _linear([self._num_writes], name="write_strengths")
+        controls = {
+            # v_t^i - The vectors to write to memory, for each write head `i`.
+            "write_vectors": [self._num_writes, self._word_size],
+            # e_t^i - Amount to erase the memory by before writing, for each write
+            # head.
+            "erase_vectors": [self._num_writes, self._word_size],
+            # f_t^j - Amount that the memory at the locations read from at the
+            # previous time step can be declared unused, for each read head `j`.
+            "free_gate": [self._num_reads],
+            # g_t^{a, i} - Interpolation between writing to unallocated memory and
+            # content-based lookup, for each write head `i`. Note: `a` is simply
+            # used to identify this gate with allocation vs writing (as defined
+            # below).
+            "allocation_gate": [self._num_writes],
+            # g_t^{w, i} - Overall gating of write amount for each write head.
+            "write_gate": [self._num_writes],
+            # \pi_t^j - Mixing between "backwards" and "forwards" positions (for
+            # each write head), and content-based lookup, for each read head.
+            "read_mode": [self._num_reads, num_read_modes],
+            # Parameters for the (read / write) "weights by content matching"
+            # modules.
+            "write_content_keys": [self._num_writes, self._word_size],
+            "write_content_strengths": [self._num_writes],
+            "read_content_keys": [self._num_reads, self._word_size],
+            "read_content_strengths": [self._num_reads],
+        }
 
-        read_keys = _linear([self._num_reads, self._word_size], "read_keys")
-        read_strengths = _linear([self._num_reads], name="read_strengths")
+        # All controls are computed with a single matmul, then split and reshaped.
+        sizes = [int(np.prod(dims)) for dims in controls.values()]
+        if self._interface_linear is None:
+            self._interface_linear = snt.Linear(sum(sizes), name="interface")
+        flat_controls = tf.split(self._interface_linear(inputs), sizes, axis=1)
 
         result = {
-            "read_content_keys": read_keys,
-            "read_content_strengths": read_strengths,
-            "write_content_keys": write_keys,
-            "write_content_strengths": write_strengths,
-            "write_vectors": write_vectors,
-            "erase_vectors": erase_vectors,
-            "free_gate": free_gate,
-            "allocation_gate": allocation_gate,
-            "write_gate": write_gate,
-            "read_mode": read_mode,
+            name: tf.reshape(control, [-1, *dims])
+            for (name, dims), control in zip(controls.items(), flat_controls)
         }
+        for name in ["erase_vectors", "free_gate", "allocation_gate", "write_gate"]:
+            result[name] = tf.sigmoid(result[name], name=name + "_activation")
+        result["read_mode"] = tf.nn.softmax(
+            result["read_mode"], name="read_mode_activation"
+        )
         return result
 
     def _write_weights(self, inputs, memory, usage):
@@ -298,7 +432,8 @@ class MemoryAccess(snt.RNNCore):
           prev_read_weights: A tensor of shape `[batch_size, num_reads,
               memory_size]` containing the previous read locations.
           link: A tensor of shape `[batch_size, num_writes, memory_size,
-              memory_size]` containing the temporal write transition graphs.
+              memory_size]` containing the temporal write transition graphs, or
+              its sparse form if the linkage keeps only the top entries.
 
         Returns:
           A tensor of shape `[batch_size, num_reads, memory_size]` containing the
@@ -310,35 +445,38 @@ class MemoryAccess(snt.RNNCore):
         )
 
         # Calculates f_t^i and b_t^i.
-        forward_weights = self._linkage.directional_read_weights(
-            link, prev_read_weights, forward=True
-        )
-        backward_weights = self._linkage.directional_read_weights(
-            link, prev_read_weights, forward=False
+        forward_weights, backward_weights = self._linkage.directional_read_weights_both(
+            link, prev_read_weights
         )
 
+        if self._num_writes == 1:
+            read_mode = inputs["read_mode"]
+            return (
+                read_mode[:, :, 2, None] * content_weights
+                + read_mode[:, :, 1, None] * forward_weights[:, :, 0]
+                + read_mode[:, :, 0, None] * backward_weights[:, :, 0]
+            )
+
         backward_mode = inputs["read_mode"][:, :, : self._num_writes]
         forward_mode = inputs["read_mode"][
             :, :, self._num_writes : 2 * self._num_writes
         ]
         content_mode = inputs["read_mode"][:, :, 2 * self._num_writes]
 
+        # Contracts the modes over write heads without materializing the
+        # `[batch_size, num_reads, num_writes, memory_size]` products.
         read_weights = (
-            tf.expand_dims(content_mode, 2) * content_weights
-            + tf.reduce_sum(
-                input_tensor=tf.expand_dims(forward_mode, 3) * forward_weights, axis=2
-            )
-            + tf.reduce_sum(
-                input_tensor=tf.expand_dims(backward_mode, 3) * backward_weights, axis=2
-            )
+            tf.einsum("br,brm->brm", content_mode, content_weights)
+            + tf.einsum("brw,brwm->brm", forward_mode, forward_weights)
+            + tf.einsum("brw,brwm->brm", backward_mode, backward_weights)
         )
 
         return read_weights
 
     # keras uses get_initial_state
     def get_initial_state(self, batch_size=None, inputs=None, dtype=None):
-        return util.initial_state_from_state_size(
-            self.state_size, batch_size, self._dtype
+        return util.cached_initial_state(
+            self._initial_state_cache, self.state_size, batch_size, self.state_dtype
         )
 
     # snt.RNNCore uses initial_state
@@ -348,7 +486,7 @@ class MemoryAccess(snt.RNNCore):
     @property
     def state_size(self):
         """Returns a list of the shape of the state tensors."""
-        return [
+        state_size = [
             #  memory
             tf.TensorShape([self._memory_size, self._word_size]),
             #  read_weights
@@ -360,8 +498,31 @@ class MemoryAccess(snt.RNNCore):
             #  usage
             self._freeness.state_size,
         ]
+        if self._quantize_memory:
+            #  memory_scale
+            state_size.append(tf.TensorShape([self._memory_size]))
+        return state_size
+
+    @property
+    def state_dtype(self):
+        """Returns a list of the state tensors' dtypes, matching `state_size`."""
+        state_dtype = [
+            tf.int8 if self._quantize_memory else self._dtype,
+            self._dtype,
+            self._dtype,
+            self._linkage.state_dtype,
+            self._dtype,
+        ]
+        if self._quantize_memory:
+            state_dtype.append(self._dtype)
+        return state_dtype
 
     @property
     def output_size(self):
         """Returns the output shape."""
         return tf.TensorShape([self._num_reads, self._word_size])
+
+    @property
+    def numba(self):
+        """Returns whether the step runs with `numba_step.access_step`."""
+        return self._numba
@@ -114,10 +114,20 @@ class TemporalLinkage(snt.RNNCore):
 
     The function `directional_read_weights` computes addresses following the
     forward and backward directions in the link graphs.
+
+    If `link_top_k` is given, `link` is stored sparsely as a pair `[link_values,
+    link_indices]` keeping only the `link_top_k` largest entries of every row of
+    the link graphs, which shrinks the `O(memory_size^2)` state. `link_indices`
+    are int32, as low precision float dtypes cannot hold them exactly.
     """
 
     def __init__(
-        self, memory_size, num_writes, name="temporal_linkage", dtype=tf.float32
+        self,
+        memory_size,
+        num_writes,
+        name="temporal_linkage",
+        dtype=tf.float32,
+        link_top_k=None,
     ):
         """Construct a TemporalLinkage module.
 
@@ -125,11 +135,18 @@ class TemporalLinkage(snt.RNNCore):
           memory_size: The number of memory slots.
           num_writes: The number of write heads.
           name: Name of the module.
+          link_top_k: Optional number of entries to keep per row of the link
+              graphs. The link is stored densely if this is not given or is not
+              smaller than `memory_size`.
         """
         super(TemporalLinkage, self).__init__(name=name)
         self._memory_size = memory_size
         self._num_writes = num_writes
         self._dtype = dtype
+        if link_top_k is not None and link_top_k < memory_size:
+            self._link_top_k = link_top_k
+        else:
+            self._link_top_k = None
 
     def __call__(self, write_weights, prev_state):
         """Calculate the updated linkage state given the write weights.
@@ -138,8 +155,9 @@ class TemporalLinkage(snt.RNNCore):
           write_weights: A tensor of shape `[batch_size, num_writes, memory_size]`
               containing the memory addresses of the different write heads.
           prev_state: list of tensors containg a tensor `link` of
-              shape `[batch_size, num_writes, memory_size, memory_size]`, and a
-              tensor `precedence_weights` of shape `[batch_size, num_writes,
+              shape `[batch_size, num_writes, memory_size, memory_size]` (or its
+              sparse `[link_values, link_indices]` form), and a tensor
+              `precedence_weights` of shape `[batch_size, num_writes,
               memory_size]` containing the aggregated history of recent writes.
 
         Returns:
@@ -148,11 +166,67 @@ class TemporalLinkage(snt.RNNCore):
         """
         prev_link, prev_precedence_weights = prev_state
 
+        link = self._link(
+            self.dense_link(prev_link), prev_precedence_weights, write_weights
+        )
         return [
-            self._link(prev_link, prev_precedence_weights, write_weights),
+            self._sparse_link(link),
             self._precedence_weights(prev_precedence_weights, write_weights),
         ]
 
+    def unroll(self, write_weights, prev_state):
+        """Calculates the linkage states for a whole sequence of write weights.
+
+        This is equivalent to calling the module once per time step, but both the
+        precedence weights and the link graphs are linear recurrences, which are
+        evaluated with a parallel scan over time (`O(log T)` sequential steps).
+        `T` may be dynamic (e.g. in a `tf.function` with a `None` time
+        dimension).
+
+        Args:
+          write_weights: A tensor of shape `[T, batch_size, num_writes,
+              memory_size]` containing the write weights at every time step.
+          prev_state: list of tensors `[link, precedence_weights]` containing the
+              linkage state before the first time step.
+
+        Returns:
+          A list of tensors `[link, precedence_weights]`, of shapes `[T,
+          batch_size, num_writes, memory_size, memory_size]` and `[T, batch_size,
+          num_writes, memory_size]`, containing the state after every time step.
+
+        Raises:
+          NotImplementedError: if the link is stored sparsely, since truncating
+            the link at every step is not a linear recurrence.
+        """
+        if self._link_top_k is not None:
+            raise NotImplementedError("Cannot unroll a sparse link with a scan.")
+        prev_link, prev_precedence_weights = prev_state
+
+        # p_t = (1 - sum_i w_t(i)) p_{t-1} + w_t
+        write_sum = tf.reduce_sum(input_tensor=write_weights, axis=3, keepdims=True)
+        precedence_weights = util.linear_recurrence_scan(
+            tf.broadcast_to(1 - write_sum, tf.shape(input=write_weights)),
+            write_weights,
+            prev_precedence_weights,
+        )
+
+        # L_t = (1 - w_t(i) - w_t(j)) L_{t-1} + w_t(i) p_{t-1}(j), where the
+        # diagonal never feeds back into the other entries, so it can be zeroed
+        # once at the end.
+        shifted_precedence_weights = tf.concat(
+            [prev_precedence_weights[None], precedence_weights[:-1]], 0
+        )
+        write_weights_i = tf.expand_dims(write_weights, 4)
+        write_weights_j = tf.expand_dims(write_weights, 3)
+        link = util.linear_recurrence_scan(
+            1 - write_weights_i - write_weights_j,
+            write_weights_i * tf.expand_dims(shifted_precedence_weights, 3),
+            prev_link,
+        )
+        link = tf.linalg.set_diag(link, tf.zeros_like(precedence_weights))
+
+        return [link, precedence_weights]
+
     def directional_read_weights(self, link, prev_read_weights, forward):
         """Calculates the forward or the backward read weights.
 
@@ -162,7 +236,8 @@ class TemporalLinkage(snt.RNNCore):
 
         Args:
           link: tensor of shape `[batch_size, num_writes, memory_size,
-              memory_size]` representing the link graphs L_t.
+              memory_size]` representing the link graphs L_t, or its sparse
+              `[link_values, link_indices]` form.
           prev_read_weights: tensor of shape `[batch_size, num_reads,
               memory_size]` containing the previous read weights w_{t-1}^r.
           forward: Boolean indicating whether to follow the "future" direction in
@@ -171,6 +246,11 @@ class TemporalLinkage(snt.RNNCore):
         Returns:
           tensor of shape `[batch_size, num_reads, num_writes, memory_size]`
         """
+        if self._link_top_k is not None:
+            return self._sparse_directional_read_weights(
+                link, prev_read_weights, forward
+            )
+
         # We calculate the forward and backward directions for each pair of
         # read and write heads; hence we need to tile the read weights and do a
         # sort of "outer product" to get this.
@@ -179,6 +259,87 @@ class TemporalLinkage(snt.RNNCore):
         # Swap dimensions 1, 2 so order is [batch, reads, writes, memory]:
         return tf.transpose(a=result, perm=[0, 2, 1, 3])
 
+    def directional_read_weights_both(self, link, prev_read_weights):
+        """Calculates both the forward and the backward read weights.
+
+        This is equivalent to calling `directional_read_weights` with `forward`
+        set to True and to False, but computes both directions together so that
+        the link graphs are only read once.
+
+        Args:
+          link: tensor of shape `[batch_size, num_writes, memory_size,
+              memory_size]` representing the link graphs L_t, or its sparse
+              `[link_values, link_indices]` form.
+          prev_read_weights: tensor of shape `[batch_size, num_reads,
+              memory_size]` containing the previous read weights w_{t-1}^r.
+
+        Returns:
+          A tuple `(forward_weights, backward_weights)` of tensors of shape
+          `[batch_size, num_reads, num_writes, memory_size]`.
+        """
+        if self._link_top_k is not None:
+            return (
+                self._sparse_directional_read_weights(link, prev_read_weights, True),
+                self._sparse_directional_read_weights(link, prev_read_weights, False),
+            )
+
+        forward_weights = tf.einsum("bwij,brj->brwi", link, prev_read_weights)
+        backward_weights = tf.einsum("bwij,bri->brwj", link, prev_read_weights)
+        return forward_weights, backward_weights
+
+    def _sparse_directional_read_weights(self, link, prev_read_weights, forward):
+        """Calculates `directional_read_weights` from the sparse link."""
+        link_values, link_indices = link
+        batch_size = tf.shape(input=link_values)[0]
+        # [batch_size, num_reads, num_writes, memory_size, link_top_k]
+        link_shape = [
+            batch_size,
+            -1,
+            self._num_writes,
+            self._memory_size,
+            self._link_top_k,
+        ]
+
+        if forward:
+            # Gathers the previous read weights at the stored link columns.
+            columns = tf.reshape(link_indices, [batch_size, -1])
+            gathered = tf.gather(prev_read_weights, columns, axis=2, batch_dims=1)
+            gathered = tf.reshape(gathered, link_shape)
+            return tf.reduce_sum(
+                input_tensor=gathered * tf.expand_dims(link_values, 1), axis=4
+            )
+
+        # Scatters the weighted rows back to the stored link columns.
+        updates = (
+            tf.expand_dims(link_values, 1) * prev_read_weights[:, :, None, :, None]
+        )
+        columns = tf.broadcast_to(tf.expand_dims(link_indices, 1), tf.shape(updates))
+        updates_shape = [
+            batch_size,
+            -1,
+            self._num_writes,
+            self._memory_size * self._link_top_k,
+        ]
+        return util.batch_scatter_add(
+            tf.reshape(updates, updates_shape),
+            tf.reshape(columns, updates_shape),
+            self._memory_size,
+        )
+
+    def dense_link(self, link):
+        """Returns the dense link graphs from (possibly sparse) `link` state."""
+        if self._link_top_k is None:
+            return link
+        link_values, link_indices = link
+        return util.batch_scatter_add(link_values, link_indices, self._memory_size)
+
+    def _sparse_link(self, link):
+        """Converts dense link graphs to the stored form of the `link` state."""
+        if self._link_top_k is None:
+            return link
+        link_values, link_indices = tf.math.top_k(link, k=self._link_top_k)
+        return [link_values, link_indices]
+
     def _link(self, prev_link, prev_precedence_weights, write_weights):
         """Calculates the new link graphs.
 
@@ -239,19 +400,40 @@ class TemporalLinkage(snt.RNNCore):
 
     def initial_state(self, batch_size):
         return util.initial_state_from_state_size(
-            self.state_size, batch_size, self._dtype
+            self.state_size, batch_size, self.state_dtype
         )
 
     @property
     def state_size(self):
         """Returns a list of the state tensors' shapes."""
+        if self._link_top_k is not None:
+            sparse_shape = [self._num_writes, self._memory_size, self._link_top_k]
+            link_size = [
+                # link_values
+                tf.TensorShape(sparse_shape),
+                # link_indices
+                tf.TensorShape(sparse_shape),
+            ]
+        else:
+            link_size = tf.TensorShape(
+                [self._num_writes, self._memory_size, self._memory_size]
+            )
         return [
             # link
-            tf.TensorShape([self._num_writes, self._memory_size, self._memory_size]),
+            link_size,
             # precedence_weights
             tf.TensorShape([self._num_writes, self._memory_size]),
         ]
 
+    @property
+    def state_dtype(self):
+        """Returns a list of the state tensors' dtypes, matching `state_size`."""
+        if self._link_top_k is not None:
+            link_dtype = [self._dtype, tf.int32]
+        else:
+            link_dtype = self._dtype
+        return [link_dtype, self._dtype]
+
 
 class Freeness(snt.RNNCore):
     """Memory usage that is increased by writing and decreased by reading.
@@ -331,6 +513,11 @@ class Freeness(snt.RNNCore):
               freeness-based write locations. Note that this isn't scaled by
               `write_gate`; this scaling must be applied externally.
         """
+        # A single write head allocates from the current usage, with no simulated
+        # usage update.
+        if num_writes == 1:
+            return tf.expand_dims(self._allocation(usage), 1)
+
         # expand gatings over memory locations
         write_gates = tf.expand_dims(write_gates, -1)
 
@@ -400,7 +587,7 @@ class Freeness(snt.RNNCore):
         sorted_usage = 1 - sorted_nonusage
         prod_sorted_usage = tf.math.cumprod(sorted_usage, axis=1, exclusive=True)
         sorted_allocation = sorted_nonusage * prod_sorted_usage
-        inverse_indices = tf.cast(util.batch_invert_permutation(indices), tf.int32)
+        inverse_indices = util.batch_invert_permutation(indices)
 
         # This final line "unsorts" sorted_allocation, so that the indexing
         # corresponds to the original indexing of `usage`.
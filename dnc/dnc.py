@@ -22,6 +22,8 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import functools
+import numpy as np
 import sonnet as snt
 import tensorflow as tf
 
@@ -73,16 +75,36 @@ class DNC(snt.RNNCore):
         self._access = access.MemoryAccess(**access_config, dtype=dtype)
 
         self._output_size = output_size
+        self._initial_state_cache = {}
         self._batch_size = batch_size
         self._clip_value = clip_value or 0
-
-        self._output_linear = snt.Linear(output_size=output_size, name="output_linear")
-
-    def _clip_if_enabled(self, x):
+        # Decides once whether to clip, rather than on every step.
         if self._clip_value > 0:
-            return tf.clip_by_value(x, -self._clip_value, self._clip_value)
+            self._clip = functools.partial(
+                tf.clip_by_value,
+                clip_value_min=-self._clip_value,
+                clip_value_max=self._clip_value,
+            )
         else:
-            return x
+            self._clip = lambda x: x
+
+        # The output layer acts on the concatenation of the controller output and
+        # the flattened access output. It is split into one linear per input so
+        # that the concatenation is never materialized; both share the
+        # initialization scale of the single layer they replace.
+        output_input_size = (
+            self._controller.output_size + self._access.output_size.num_elements()
+        )
+        w_init = snt.initializers.TruncatedNormal(stddev=1 / np.sqrt(output_input_size))
+        self._controller_output_linear = snt.Linear(
+            output_size=output_size, w_init=w_init, name="controller_output_linear"
+        )
+        self._access_output_linear = snt.Linear(
+            output_size=output_size,
+            with_bias=False,
+            w_init=w_init,
+            name="access_output_linear",
+        )
 
     # keras.layers.RNN abstract method
     def call(self, inputs, prev_state):
@@ -105,27 +127,34 @@ class DNC(snt.RNNCore):
           is a nested list of tensors representing the dnc state: `access_output`,
           `access_state`, and `controller_state`.
         """
+        # The Numba access step runs in `tf.numpy_function`, which XLA cannot
+        # compile.
+        if self._access.numba:
+            return self._step(inputs, prev_state)
+        return self._compiled_step(inputs, prev_state)
+
+    def _step(self, inputs, prev_state):
+        """Computes `__call__`."""
         [prev_access_output, prev_access_state, prev_controller_state] = prev_state
 
-        batch_flatten = tf.keras.layers.Flatten()
         controller_input = tf.concat(
-            [batch_flatten(inputs), batch_flatten(prev_access_output)], 1
+            [util.batch_flatten(inputs), util.batch_flatten(prev_access_output)], 1
         )
 
         controller_output, controller_state = self._controller(
             controller_input, prev_controller_state
         )
 
-        controller_output = self._clip_if_enabled(controller_output)
-        controller_state = tf.nest.map_structure(
-            self._clip_if_enabled, controller_state
-        )
+        controller_output = self._clip(controller_output)
+        # The LSTM state is a flat `[h, c]` list.
+        controller_state = [self._clip(state) for state in controller_state]
 
         access_output, access_state = self._access(controller_output, prev_access_state)
 
-        output = tf.concat([controller_output, batch_flatten(access_output)], 1)
-        output = self._output_linear(output)
-        output = self._clip_if_enabled(output)
+        access_output_flat = util.batch_flatten(access_output)
+        output = self._controller_output_linear(controller_output)
+        output += self._access_output_linear(access_output_flat)
+        output = self._clip(output)
 
         return (
             output,
@@ -136,10 +165,13 @@ class DNC(snt.RNNCore):
             ],
         )
 
+    # `_step` compiled with XLA, which fuses the controller and access updates.
+    _compiled_step = tf.function(_step, jit_compile=True, reduce_retracing=True)
+
     # keras.layers.RNN uses get_initial_state
     def get_initial_state(self, batch_size=None, inputs=None, dtype=None):
-        return util.initial_state_from_state_size(
-            self.state_size, batch_size, self._dtype
+        return util.cached_initial_state(
+            self._initial_state_cache, self.state_size, batch_size, self.state_dtype
         )
 
     # sonnet.RNNCore uses initial_state
@@ -157,6 +189,18 @@ class DNC(snt.RNNCore):
             self._controller.state_size,
         ]
 
+    @property
+    def state_dtype(self):
+        """Returns the dtypes of the state tensors, matching `state_size`."""
+        return [
+            #  access_output
+            self._dtype,
+            #  access_state, which may not be all `dtype` (e.g. quantized memory)
+            self._access.state_dtype,
+            #  controller_state
+            tf.nest.map_structure(lambda _: self._dtype, self._controller.state_size),
+        ]
+
     @property
     def output_size(self):
         return tf.TensorShape([self._output_size])
@@ -0,0 +1,230 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Numba implementation of the DNC memory access step.
+
+For CPU inference with small batches and memories, the per-op overhead of
+TensorFlow dominates the `MemoryAccess` step. `access_step` computes the math of
+`access.MemoryAccess` (after the controls have been read from the controller
+output) on NumPy arrays, compiled with Numba. Results agree with TF up to
+rounding, which over many steps can change which of two nearly tied slots gets
+allocated.
+
+Numba compiles one specialization per argument dtype and caches it on disk, so
+different memory sizes reuse the same compiled code.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+from numba import njit
+
+# Matches `addressing._EPSILON`.
+_EPSILON = 1e-6
+
+# Names of the controls passed to `access_step`, in order.
+CONTROLS = (
+    "write_vectors",
+    "erase_vectors",
+    "free_gate",
+    "allocation_gate",
+    "write_gate",
+    "read_mode",
+    "write_content_keys",
+    "write_content_strengths",
+    "read_content_keys",
+    "read_content_strengths",
+)
+
+
+@njit(cache=True, fastmath=True)
+def _softplus(x):
+    return max(x, 0.0) + np.log1p(np.exp(-abs(x)))
+
+
+@njit(cache=True, fastmath=True)
+def _cosine_weights(memory, keys, strengths):
+    """Mirrors `addressing.CosineWeights` with the default softplus strengths."""
+    batch_size, memory_size, word_size = memory.shape
+    num_heads = keys.shape[1]
+    weights = np.empty((batch_size, num_heads, memory_size), memory.dtype)
+    for b in range(batch_size):
+        memory_norms = np.sqrt(np.sum(memory[b] * memory[b], axis=1) + _EPSILON)
+        for h in range(num_heads):
+            key_norm = np.sqrt(np.sum(keys[b, h] * keys[b, h]) + _EPSILON)
+            strength = _softplus(strengths[b, h])
+            for m in range(memory_size):
+                dot = 0.0
+                for d in range(word_size):
+                    dot += keys[b, h, d] * memory[b, m, d]
+                similarity = dot / (key_norm * memory_norms[m] + _EPSILON)
+                weights[b, h, m] = strength * similarity
+
+            # Softmax over memory locations.
+            row = weights[b, h]
+            row[:] = np.exp(row - row.max())
+            row /= row.sum()
+    return weights
+
+
+@njit(cache=True, fastmath=True)
+def _allocation(usage):
+    """Mirrors `addressing.Freeness._allocation` for one row of usage.
+
+    The ops follow TF in the dtype of `usage`: slots are ordered by `1 - usage`,
+    which ties for nearly unused slots, and like `top_k` ties go to the lowest
+    index.
+    """
+    one = usage.dtype.type(1)
+    epsilon = usage.dtype.type(_EPSILON)
+    nonusage = one - (epsilon + (one - epsilon) * usage)
+    allocation = np.empty_like(usage)
+    prod_sorted_usage = one
+    # A stable sort breaks ties by lowest index, like `top_k`.
+    for m in np.argsort(-nonusage, kind="mergesort"):
+        allocation[m] = nonusage[m] * prod_sorted_usage
+        prod_sorted_usage *= one - nonusage[m]
+    return allocation
+
+
+@njit(cache=True, fastmath=True)
+def access_step(
+    prev_memory,
+    prev_read_weights,
+    prev_write_weights,
+    prev_link,
+    prev_precedence_weights,
+    prev_usage,
+    write_vectors,
+    erase_vectors,
+    free_gate,
+    allocation_gate,
+    write_gate,
+    read_mode,
+    write_content_keys,
+    write_content_strengths,
+    read_content_keys,
+    read_content_strengths,
+):
+    """Computes one `MemoryAccess` step on NumPy arrays.
+
+    The state arguments have the shapes of `MemoryAccess.state_size` (with a
+    dense link), and the controls are those returned by
+    `MemoryAccess._read_inputs`, in the order given by `CONTROLS`.
+
+    Returns:
+      A tuple `(read_words, memory, read_weights, write_weights, link,
+      precedence_weights, usage)` of arrays.
+    """
+    batch_size, memory_size, word_size = prev_memory.shape
+    num_reads = prev_read_weights.shape[1]
+    num_writes = prev_write_weights.shape[1]
+
+    # Usage u_t, as in `addressing.Freeness`.
+    usage = prev_usage.copy()
+    for b in range(batch_size):
+        for m in range(memory_size):
+            not_written = 1.0
+            for w in range(num_writes):
+                not_written *= 1 - prev_write_weights[b, w, m]
+            usage[b, m] += (1 - usage[b, m]) * (1 - not_written)
+            phi = 1.0
+            for r in range(num_reads):
+                phi *= 1 - free_gate[b, r] * prev_read_weights[b, r, m]
+            usage[b, m] *= phi
+
+    # Write weights, as in `MemoryAccess._write_weights`.
+    write_content_weights = _cosine_weights(
+        prev_memory, write_content_keys, write_content_strengths
+    )
+    write_weights = np.empty_like(prev_write_weights)
+    for b in range(batch_size):
+        simulated_usage = usage[b].copy()
+        for w in range(num_writes):
+            allocation = _allocation(simulated_usage)
+            gate = allocation_gate[b, w] * write_gate[b, w]
+            simulated_usage += (1 - simulated_usage) * gate * allocation
+            write_weights[b, w] = write_gate[b, w] * (
+                allocation_gate[b, w] * allocation
+                + (1 - allocation_gate[b, w]) * write_content_weights[b, w]
+            )
+
+    # Erase and write, as in `access._erase_and_write`.
+    memory = np.empty_like(prev_memory)
+    for b in range(batch_size):
+        for m in range(memory_size):
+            for d in range(word_size):
+                reset_gate = 1.0
+                added = 0.0
+                for w in range(num_writes):
+                    reset_gate *= 1 - write_weights[b, w, m] * erase_vectors[b, w, d]
+                    added += write_weights[b, w, m] * write_vectors[b, w, d]
+                memory[b, m, d] = prev_memory[b, m, d] * reset_gate + added
+
+    # Link and precedence weights, as in `addressing.TemporalLinkage`.
+    link = np.empty_like(prev_link)
+    precedence_weights = np.empty_like(prev_precedence_weights)
+    for b in range(batch_size):
+        for w in range(num_writes):
+            weights = write_weights[b, w]
+            prev_precedence = prev_precedence_weights[b, w]
+            write_sum = weights.sum()
+            for i in range(memory_size):
+                for j in range(memory_size):
+                    if i == j:
+                        # No self-looping edges.
+                        link[b, w, i, j] = 0
+                    else:
+                        scale = 1 - weights[i] - weights[j]
+                        new_link = weights[i] * prev_precedence[j]
+                        link[b, w, i, j] = scale * prev_link[b, w, i, j] + new_link
+                precedence = (1 - write_sum) * prev_precedence[i] + weights[i]
+                precedence_weights[b, w, i] = precedence
+
+    # Read weights, as in `MemoryAccess._read_weights`.
+    read_weights = _cosine_weights(memory, read_content_keys, read_content_strengths)
+    for b in range(batch_size):
+        for r in range(num_reads):
+            read_weights[b, r] *= read_mode[b, r, 2 * num_writes]
+            for w in range(num_writes):
+                backward_mode = read_mode[b, r, w]
+                forward_mode = read_mode[b, r, num_writes + w]
+                for i in range(memory_size):
+                    for j in range(memory_size):
+                        transition = link[b, w, i, j]
+                        read_weights[b, r, i] += (
+                            forward_mode * transition * prev_read_weights[b, r, j]
+                        )
+                        read_weights[b, r, j] += (
+                            backward_mode * transition * prev_read_weights[b, r, i]
+                        )
+
+    read_words = np.zeros((batch_size, num_reads, word_size), memory.dtype)
+    for b in range(batch_size):
+        for r in range(num_reads):
+            for m in range(memory_size):
+                for d in range(word_size):
+                    read_words[b, r, d] += read_weights[b, r, m] * memory[b, m, d]
+
+    return (
+        read_words,
+        memory,
+        read_weights,
+        write_weights,
+        link,
+        precedence_weights,
+        usage,
+    )
@@ -24,69 +24,157 @@ import tensorflow as tf
 
 def batch_invert_permutation(permutations):
     """Returns batched `tf.invert_permutation` for every row in `permutations`."""
-    perm = tf.cast(permutations, tf.float32)
-    dim = int(perm.get_shape()[-1])
-    size = tf.cast(tf.shape(input=perm)[0], tf.float32)
-    delta = tf.cast(tf.shape(input=perm)[-1], tf.float32)
-    rg = tf.range(0, size * delta, delta, dtype=tf.float32)
-    rg = tf.expand_dims(rg, 1)
-    rg = tf.tile(rg, [1, dim])
-    perm = tf.add(perm, rg)
-    flat = tf.reshape(perm, [-1])
-    perm = tf.math.invert_permutation(tf.cast(flat, tf.int32))
-    perm = tf.reshape(perm, [-1, dim])
-    return tf.subtract(perm, tf.cast(rg, tf.int32))
+    permutations = tf.cast(permutations, tf.int32)
+    shape = tf.shape(input=permutations)
+    batch_index = tf.broadcast_to(tf.range(shape[0])[:, None], shape)
+    indices = tf.stack([batch_index, permutations], axis=-1)
+    # Scatters position j of each row to the index given by its permutation.
+    positions = tf.broadcast_to(tf.range(shape[1]), shape)
+    return tf.scatter_nd(indices, positions, shape)
 
 
 def batch_gather(values, indices):
     """Returns batched `tf.gather` for every row in the input."""
-    idx = tf.expand_dims(tf.cast(indices, tf.int32), -1)
-    size = tf.shape(input=indices)[0]
-    rg = tf.range(tf.cast(size, tf.int32), dtype=tf.int32)
-    rg = tf.expand_dims(rg, -1)
-    rg = tf.tile(rg, [1, int(indices.get_shape()[-1])])
-    rg = tf.expand_dims(rg, -1)
-    gidx = tf.concat([rg, idx], -1)
-    return tf.gather_nd(values, gidx)
+    return tf.gather(values, indices, batch_dims=1)
 
 
-def one_hot(length, index):
-    """Return an nd array of given `length` filled with 0s and a 1 at `index`."""
-    result = np.zeros(length)
-    result[index] = 1
+def batch_scatter_add(updates, indices, depth):
+    """Sums `updates` into a zero tensor with last dimension `depth`.
+
+    Args:
+      updates: tensor of shape `[..., n]`.
+      indices: integer tensor of the same shape as `updates`, with values in
+          `[0, depth)`, giving the position along the last axis of each update.
+      depth: size of the last axis of the result.
+
+    Returns:
+      Tensor of shape `[..., depth]` where every row holds the sum of the
+      `updates` scattered to their `indices`.
+    """
+    shape = tf.shape(input=updates)
+    num_rows = tf.reduce_prod(shape[:-1])
+    offsets = tf.range(num_rows) * depth
+    segment_ids = tf.reshape(indices, [num_rows, -1]) + offsets[:, None]
+    result = tf.math.unsorted_segment_sum(
+        tf.reshape(updates, [-1]), tf.reshape(segment_ids, [-1]), num_rows * depth
+    )
+    result = tf.reshape(result, tf.concat([shape[:-1], [depth]], 0))
+    result.set_shape(updates.shape[:-1].concatenate([depth]))
     return result
 
 
+def batch_flatten(x):
+    """Reshapes `x` to `[batch_size, -1]`, keeping the static flattened size."""
+    num_elements = x.shape[1:].num_elements()
+    if num_elements is None:
+        # Some non-batch dimension is only known at runtime.
+        return tf.reshape(x, [tf.shape(x)[0], -1])
+    return tf.reshape(x, [-1, num_elements])
+
+
+def one_hot(length, index):
+    """Return an nd array of given `length` filled with 0s and a 1 at `index`.
+
+    `index` may also be an array of indices, giving one row per index.
+    """
+    if np.ndim(index) == 0:
+        result = np.zeros(length)
+        result[index] = 1
+        return result
+    return np.eye(length)[index]
+
+
 def reduce_prod(x, axis, name=None):
     """Efficient reduce product over axis.
 
-    Uses tf.cumprod and tf.gather_nd as a workaround to the poor performance of calculating tf.reduce_prod's gradient on CPU.
+    The forward pass is a plain `tf.math.reduce_prod`. The gradient is computed
+    from an exclusive left and an exclusive right cumulative product along
+    `axis`, i.e. the product of every other element, which is linear in the
+    size of `axis` and well defined when some elements are zero.
+    """
+
+    @tf.custom_gradient
+    def _reduce_prod(x):
+        def grad(dy):
+            left = tf.math.cumprod(x, axis, exclusive=True)
+            right = tf.math.cumprod(x, axis, exclusive=True, reverse=True)
+            return left * right * tf.expand_dims(dy, axis)
+
+        return tf.math.reduce_prod(x, axis=axis), grad
+
+    with tf.name_scope(name or "util_reduce_prod"):
+        return _reduce_prod(x)
+
 
-    As of TF2, reduce_prod seems not to be the a culprit of increased timings:
-    https://github.com/tensorflow/tensorflow/issues/40748
+def linear_recurrence_scan(a, b, initial):
+    """Solves `x_t = a_t * x_{t-1} + b_t` for every `t` with a parallel scan.
 
-    Workaround code for future reference:
+    The recurrence is associative in the pairs `(a_t, b_t)`, so it is evaluated
+    with a Hillis-Steele prefix scan taking `log2(T)` elementwise steps rather
+    than `T` sequential ones. If `T` is not known statically, the steps run in
+    a `tf.while_loop`.
 
-    with tf.compat.v1.name_scope(name, 'util_reduce_prod', values=[x]):
-        cp = tf.math.cumprod(x, axis, reverse=True)
-        size = tf.shape(input=cp)[0]
-        idx1 = tf.range(tf.cast(size, tf.float32), dtype=tf.float32)
-        idx2 = tf.zeros([size], tf.float32)
-        indices = tf.stack([idx1, idx2], 1)
-        return tf.gather_nd(cp, tf.cast(indices, tf.int32))
+    Args:
+      a: tensor of shape `[T, ...]` of multiplicative coefficients.
+      b: tensor of shape `[T, ...]` of additive terms, the same shape as `a`.
+      initial: tensor `x_{-1}`, broadcastable to `a[0]`.
+
+    Returns:
+      Tensor of shape `[T, ...]` with `x_t` for every time step.
     """
-    return tf.math.reduce_prod(x, axis=axis, name=name)
+
+    def _compose(shift, a, b):
+        # Composes each step with the prefix ending `shift` steps earlier.
+        prev_a = tf.concat([tf.ones_like(a[:shift]), a[:-shift]], 0)
+        prev_b = tf.concat([tf.zeros_like(b[:shift]), b[:-shift]], 0)
+        return shift * 2, a * prev_a, a * prev_b + b
+
+    num_steps = a.shape[0]
+    if num_steps is None:
+        num_steps = tf.shape(input=a)[0]
+        _, a, b = tf.while_loop(
+            lambda shift, a, b: shift < num_steps, _compose, [tf.constant(1), a, b]
+        )
+    else:
+        shift = 1
+        while shift < num_steps:
+            shift, a, b = _compose(shift, a, b)
+    return a * initial + b
 
 
 # Utility function to convert nested state_size to compatible zero initial_state.
+# `dtype` is either a single dtype, or a nest of dtypes matching `state_size`.
 def initial_state_from_state_size(state_size, batch_size, dtype):
-    if isinstance(state_size, int):
-        return tf.zeros([batch_size, state_size], dtype=dtype)
-    if isinstance(state_size, tf.TensorShape):
-        return tf.zeros([batch_size] + state_size.as_list(), dtype=dtype)
-    elif isinstance(state_size, list):
-        return [initial_state_from_state_size(s, batch_size, dtype) for s in state_size]
-
-    raise NotImplementedError(
-        f"Cannot parse initial_state from state_size of type {type(state_size)}: {state_size}"
-    )
+    def _zeros(size, dtype):
+        if isinstance(size, int):
+            return tf.zeros([batch_size, size], dtype=dtype)
+        if isinstance(size, tf.TensorShape):
+            return tf.zeros([batch_size] + size.as_list(), dtype=dtype)
+
+        raise NotImplementedError(
+            f"Cannot parse initial_state from state_size of type {type(size)}: {size}"
+        )
+
+    if isinstance(dtype, (list, tuple)):
+        return tf.nest.map_structure(_zeros, state_size, dtype)
+    return tf.nest.map_structure(lambda size: _zeros(size, dtype), state_size)
+
+
+def cached_initial_state(cache, state_size, batch_size, dtype):
+    """Returns `initial_state_from_state_size`, reusing eager results in `cache`.
+
+    Eager zero states are immutable, so they are built once per `(batch_size,
+    dtype)` and stored in the dict `cache`. In graph mode (e.g. inside a
+    `tf.function`) the state is always rebuilt, since tensors cannot be shared
+    between graphs.
+    """
+    if not tf.executing_eagerly() or batch_size is None:
+        return initial_state_from_state_size(state_size, batch_size, dtype)
+
+    batch_size = int(batch_size)
+    dtype_names = [tf.as_dtype(dtype).name for dtype in tf.nest.flatten(dtype)]
+    key = "/".join([str(batch_size)] + dtype_names)
+    if key not in cache:
+        cache[key] = initial_state_from_state_size(state_size, batch_size, dtype)
+    # Copies the nested lists so that callers may modify the structure.
+    return tf.nest.map_structure(lambda x: x, cache[key])
@@ -18,6 +18,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import unittest
 import numpy as np
 import tensorflow as tf
 from tensorflow.python.framework import random_seed
@@ -66,6 +67,115 @@ class MemoryAccessTest(tf.test.TestCase):
         optimizer = tf.keras.optimizers.SGD(learning_rate=0.1)
         optimizer.apply_gradients(zip(gradients, self.module.trainable_variables))
 
+    def testEraseAndWrite(self):
+        for num_writes in [1, NUM_WRITES]:
+            memory = np.random.randn(BATCH_SIZE, MEMORY_SIZE, WORD_SIZE)
+            address = np.random.rand(BATCH_SIZE, num_writes, MEMORY_SIZE)
+            reset_weights = np.random.rand(BATCH_SIZE, num_writes, WORD_SIZE)
+            values = np.random.randn(BATCH_SIZE, num_writes, WORD_SIZE)
+
+            if num_writes == 1:
+                erase_and_write = access._erase_and_write_single
+            else:
+                erase_and_write = access._erase_and_write
+            result = erase_and_write(
+                tf.constant(memory, dtype=DTYPE),
+                tf.constant(address, dtype=DTYPE),
+                tf.constant(reset_weights, dtype=DTYPE),
+                tf.constant(values, dtype=DTYPE),
+            )
+
+            # Manually erase with every write head, then add their values.
+            reset_gate = np.prod(
+                1 - address[:, :, :, None] * reset_weights[:, :, None, :], axis=1
+            )
+            expected = memory * reset_gate + np.einsum("bwm,bwd->bmd", address, values)
+            self.assertAllClose(result, expected, atol=1e-5, rtol=1e-5)
+
+    def testEraseAndWriteComputeDtype(self):
+        memory = tf.random.normal([BATCH_SIZE, MEMORY_SIZE, WORD_SIZE], dtype=DTYPE)
+        address = tf.random.uniform([BATCH_SIZE, NUM_WRITES, MEMORY_SIZE], dtype=DTYPE)
+        reset_weights = tf.random.uniform(
+            [BATCH_SIZE, NUM_WRITES, WORD_SIZE], dtype=DTYPE
+        )
+        values = tf.random.normal([BATCH_SIZE, NUM_WRITES, WORD_SIZE], dtype=DTYPE)
+
+        expected = access._erase_and_write(memory, address, reset_weights, values)
+        result = access._erase_and_write(
+            memory, address, reset_weights, values, compute_dtype=tf.bfloat16
+        )
+
+        # The add matrix is computed in bfloat16 but returned in the memory dtype.
+        self.assertEqual(result.dtype, DTYPE)
+        self.assertAllClose(result, expected, atol=5e-2, rtol=5e-2)
+
+    @unittest.skipIf(access.numba_step is None, "requires numba")
+    def testNumbaStep(self):
+        cell = access.MemoryAccess(
+            MEMORY_SIZE, WORD_SIZE, NUM_READS, NUM_WRITES, numba=True
+        )
+
+        def rand_weights(*shape):
+            weights = np.random.rand(*shape)
+            return weights / (weights.sum(-1, keepdims=True) + 1)
+
+        link = rand_weights(BATCH_SIZE, NUM_WRITES, MEMORY_SIZE, MEMORY_SIZE)
+        link *= 1 - np.eye(MEMORY_SIZE)
+        prev_state = tf.nest.map_structure(
+            lambda x: tf.constant(x, dtype=DTYPE),
+            [
+                np.random.randn(BATCH_SIZE, MEMORY_SIZE, WORD_SIZE),
+                rand_weights(BATCH_SIZE, NUM_READS, MEMORY_SIZE),
+                rand_weights(BATCH_SIZE, NUM_WRITES, MEMORY_SIZE),
+                [link, rand_weights(BATCH_SIZE, NUM_WRITES, MEMORY_SIZE)],
+                np.random.rand(BATCH_SIZE, MEMORY_SIZE),
+            ],
+        )
+        inputs = tf.random.normal([BATCH_SIZE, INPUT_SIZE], dtype=DTYPE)
+
+        # The Numba kernel should match the TensorFlow step of the same cell.
+        result = cell(inputs, prev_state)
+        expected = cell._step(inputs, prev_state)
+        tf.nest.map_structure(
+            lambda x, y: self.assertAllClose(x, y, atol=1e-5, rtol=1e-5),
+            result,
+            expected,
+        )
+
+    @unittest.skipIf(access.numba_step is None, "requires numba")
+    def testNumbaStepFromInitialState(self):
+        # The zero initial state ties every usage, so both paths must break the
+        # ties the same way to allocate the same memory slots to each write head.
+        for num_writes in [1, NUM_WRITES]:
+            cell = access.MemoryAccess(
+                MEMORY_SIZE, WORD_SIZE, NUM_READS, num_writes, numba=True
+            )
+            state = cell.get_initial_state(batch_size=BATCH_SIZE)
+            inputs = tf.random.normal([BATCH_SIZE, INPUT_SIZE], dtype=DTYPE)
+            tf.nest.map_structure(
+                lambda x, y: self.assertAllClose(x, y, atol=1e-5, rtol=1e-5),
+                cell(inputs, state),
+                cell._step(inputs, state),
+            )
+
+    def testQuantizeMemory(self):
+        memory = tf.random.normal([BATCH_SIZE, MEMORY_SIZE, WORD_SIZE], dtype=DTYPE)
+        quantized, scale = access._quantize(memory)
+        self.assertEqual(quantized.dtype, tf.int8)
+
+        # Rounding to int8 loses at most half a step of each slot's scale.
+        error = tf.abs(access._dequantize(quantized, scale) - memory)
+        self.assertAllLessEqual(error - scale[:, :, None] / 2, 1e-6)
+
+        cell = access.MemoryAccess(
+            MEMORY_SIZE, WORD_SIZE, NUM_READS, NUM_WRITES, quantize_memory=True
+        )
+        module = tf.keras.layers.RNN(cell=cell, time_major=True, return_state=True)
+        inputs = tf.random.normal([TIME_STEPS, BATCH_SIZE, INPUT_SIZE], dtype=DTYPE)
+        _, *state = module(inputs, initial_state=module.get_initial_state(inputs))
+        self.assertEqual(state[access.MEMORY].dtype, tf.int8)
+        self.assertEqual(state[access.MEMORY_SCALE].shape, [BATCH_SIZE, MEMORY_SIZE])
+
     def testValidReadMode(self):
         inputs = self.cell._read_inputs(
             tf.random.normal([BATCH_SIZE, INPUT_SIZE], dtype=DTYPE)
@@ -152,6 +262,38 @@ class MemoryAccessTest(tf.test.TestCase):
             read_weights[0, 0, :], util.one_hot(MEMORY_SIZE, 3), atol=1e-3
         )
 
+    def testReadWeightsSingleWrite(self):
+        cell = access.MemoryAccess(MEMORY_SIZE, WORD_SIZE, NUM_READS, num_writes=1)
+        memory = np.random.randn(BATCH_SIZE, MEMORY_SIZE, WORD_SIZE)
+        prev_read_weights = np.random.rand(BATCH_SIZE, NUM_READS, MEMORY_SIZE)
+        link = np.random.rand(BATCH_SIZE, 1, MEMORY_SIZE, MEMORY_SIZE)
+        inputs = {
+            "read_content_keys": np.random.randn(BATCH_SIZE, NUM_READS, WORD_SIZE),
+            "read_content_strengths": np.random.randn(BATCH_SIZE, NUM_READS),
+            "read_mode": np.random.dirichlet(np.ones(3), [BATCH_SIZE, NUM_READS]),
+        }
+        memory, prev_read_weights, link, inputs = tf.nest.map_structure(
+            lambda x: tf.constant(x, dtype=DTYPE),
+            (memory, prev_read_weights, link, inputs),
+        )
+
+        read_weights = cell._read_weights(inputs, memory, prev_read_weights, link)
+
+        # The single write head branch matches the general blend of read modes.
+        content_weights = cell._read_content_weights_mod(
+            memory, inputs["read_content_keys"], inputs["read_content_strengths"]
+        )
+        forward_weights, backward_weights = cell._linkage.directional_read_weights_both(
+            link, prev_read_weights
+        )
+        read_mode = inputs["read_mode"].numpy()
+        expected = (
+            read_mode[:, :, 2, None] * content_weights
+            + np.einsum("brw,brwm->brm", read_mode[:, :, 1:2], forward_weights)
+            + np.einsum("brw,brwm->brm", read_mode[:, :, 0:1], backward_weights)
+        )
+        self.assertAllClose(read_weights, expected, atol=1e-6)
+
     def testGradients(self):
         inputs = tf.constant(np.random.randn(1, BATCH_SIZE, INPUT_SIZE), dtype=DTYPE)
         initial_state = self.module.get_initial_state(inputs=inputs)
@@ -18,25 +18,51 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import zlib
 import numpy as np
 import sonnet as snt
 import tensorflow as tf
-from tensorflow.python.framework import random_seed
 
 from dnc import addressing, util
 
-# set seeds for determinism
-np.random.seed(42)
-random_seed.set_seed(42)
+# Inputs are float32, except for the gradient checks that need float64.
+DTYPE = np.float32
 
 
-class WeightedSoftmaxTest(tf.test.TestCase):
+def _normalize_rows(a, cap=False):
+    """Normalizes the last axis of `a` in place to sum to 1 (or below 1 if `cap`)."""
+    a /= a.sum(axis=-1, keepdims=True) + (1 if cap else 0)
+    return a
+
+
+class _AddressingTestMixin(object):
+    """Per-test seeded inputs and shared assertions for the addressing tests."""
+
+    def setUp(self):
+        super(_AddressingTestMixin, self).setUp()
+        # Seeds a generator per test from its name (`hash` is salted per process),
+        # so that tests draw the same inputs whatever order or worker they run in.
+        self.rng = np.random.default_rng(zlib.crc32(self.id().encode()))
+
+    def assertOneHot(self, x, index, atol=0):
+        """Checks that the non-negative weights `x` put (almost) all mass at `index`."""
+        x = np.asarray(x)
+        self.assertEqual(x.argmax(), index)
+        self.assertGreaterEqual(x[index], 1 - atol)
+        if not atol:
+            # With non-negative weights, this leaves no mass anywhere else.
+            self.assertEqual(x.sum(), 1)
+
+
+class WeightedSoftmaxTest(_AddressingTestMixin, tf.test.TestCase):
     def testValues(self):
         batch_size = 5
         num_heads = 3
         memory_size = 7
 
-        activations = np.random.randn(batch_size, num_heads, memory_size)
+        activations = self.rng.standard_normal(
+            (batch_size, num_heads, memory_size), dtype=DTYPE
+        )
         weights = np.ones((batch_size, num_heads))
 
         # Run weighted softmax with identity placed on weights. Output should be
@@ -46,17 +72,28 @@ class WeightedSoftmaxTest(tf.test.TestCase):
         self.assertAllClose(observed, expected)
 
 
-class CosineWeightsTest(tf.test.TestCase):
+class CosineWeightsTest(_AddressingTestMixin, tf.test.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super(CosineWeightsTest, cls).setUpClass()
+        # Shares modules (and their traces) between tests, keyed by
+        # `(num_heads, word_size)`.
+        cls.modules = {
+            shape: addressing.CosineWeights(*shape) for shape in [(3, 2), (4, 2)]
+        }
+
     def testShape(self):
         batch_size = 5
         num_heads = 3
         memory_size = 7
         word_size = 2
 
-        module = addressing.CosineWeights(num_heads, word_size)
-        mem = np.random.randn(batch_size, memory_size, word_size)
-        keys = np.random.randn(batch_size, num_heads, word_size)
-        strengths = np.random.randn(batch_size, num_heads)
+        module = self.modules[num_heads, word_size]
+        mem = self.rng.standard_normal(
+            (batch_size, memory_size, word_size), dtype=DTYPE
+        )
+        keys = self.rng.standard_normal((batch_size, num_heads, word_size), dtype=DTYPE)
+        strengths = self.rng.standard_normal((batch_size, num_heads), dtype=DTYPE)
         weights = module(mem, keys, strengths)
         self.assertTrue(
             weights.get_shape().is_compatible_with([batch_size, num_heads, memory_size])
@@ -68,37 +105,38 @@ class CosineWeightsTest(tf.test.TestCase):
         memory_size = 10
         word_size = 2
 
-        mem = np.random.randn(batch_size, memory_size, word_size)
+        mem = self.rng.standard_normal(
+            (batch_size, memory_size, word_size), dtype=DTYPE
+        )
         np.copyto(mem[0, 0], [1, 2])
         np.copyto(mem[0, 1], [3, 4])
         np.copyto(mem[0, 2], [5, 6])
 
-        keys = np.random.randn(batch_size, num_heads, word_size)
+        keys = self.rng.standard_normal((batch_size, num_heads, word_size), dtype=DTYPE)
         np.copyto(keys[0, 0], [5, 6])
         np.copyto(keys[0, 1], [1, 2])
         np.copyto(keys[0, 2], [5, 6])
         np.copyto(keys[0, 3], [3, 4])
-        strengths = np.random.randn(batch_size, num_heads)
+        strengths = self.rng.standard_normal((batch_size, num_heads), dtype=DTYPE)
 
-        module = addressing.CosineWeights(num_heads, word_size)
+        module = self.modules[num_heads, word_size]
         weights = module(mem, keys, strengths)
 
         # Manually checks results.
-        strengths_softplus = np.log(1 + np.exp(strengths))
-        similarity = np.zeros((memory_size))
-
-        for b in range(batch_size):
-            for h in range(num_heads):
-                key = keys[b, h]
-                key_norm = np.linalg.norm(key)
-
-                for m in range(memory_size):
-                    row = mem[b, m]
-                    similarity[m] = np.dot(key, row) / (key_norm * np.linalg.norm(row))
+        key_norms = np.linalg.norm(keys, axis=-1)
+        mem_norms = np.linalg.norm(mem, axis=-1)
+        similarity = np.einsum("bhw,bmw->bhm", keys, mem)
+        similarity /= key_norms[..., None] * mem_norms[:, None, :]
+        # Softplus, written so that large strengths do not overflow.
+        strengths_softplus = np.maximum(strengths, 0) + np.log1p(
+            np.exp(-np.abs(strengths))
+        )
+        similarity *= strengths_softplus[..., None]
 
-                similarity = np.exp(similarity * strengths_softplus[b, h])
-                similarity /= similarity.sum()
-                self.assertAllClose(weights[b, h], similarity, atol=1e-4, rtol=1e-4)
+        # Softmax over memory locations, stabilized by subtracting the max.
+        similarity = np.exp(similarity - similarity.max(-1, keepdims=True))
+        expected = similarity / similarity.sum(-1, keepdims=True)
+        self.assertAllClose(weights, expected, atol=1e-4, rtol=1e-4)
 
     def testDivideByZero(self):
         batch_size = 5
@@ -106,12 +144,12 @@ class CosineWeightsTest(tf.test.TestCase):
         memory_size = 10
         word_size = 2
 
-        module = addressing.CosineWeights(num_heads, word_size)
-        keys = tf.Variable(
-            tf.random.normal([batch_size, num_heads, word_size], dtype=tf.float64)
+        module = self.modules[num_heads, word_size]
+        keys = tf.random.stateless_normal(
+            [batch_size, num_heads, word_size], seed=(1, 2), dtype=tf.float64
         )
-        strengths = tf.Variable(
-            tf.random.normal([batch_size, num_heads], dtype=tf.float64)
+        strengths = tf.random.stateless_normal(
+            [batch_size, num_heads], seed=(3, 4), dtype=tf.float64
         )
 
         # First row of memory is non-zero to concentrate attention on this location.
@@ -120,9 +158,10 @@ class CosineWeightsTest(tf.test.TestCase):
         remaining_zeros = tf.zeros(
             [batch_size, memory_size - 1, word_size], dtype=tf.float64
         )
-        mem = tf.Variable(tf.concat((first_row_ones, remaining_zeros), 1))
+        mem = tf.concat((first_row_ones, remaining_zeros), 1)
 
         with tf.GradientTape() as gtape:
+            gtape.watch([mem, keys, strengths])
             output = module(mem, keys, strengths)
             gradients = gtape.gradient(target=output, sources=[mem, keys, strengths])
 
@@ -132,113 +171,213 @@ class CosineWeightsTest(tf.test.TestCase):
         self.assertFalse(np.any(np.isnan(gradients[2])))
 
 
-class TemporalLinkageTest(tf.test.TestCase):
+class TemporalLinkageTest(_AddressingTestMixin, tf.test.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super(TemporalLinkageTest, cls).setUpClass()
+        # Shares dense modules between tests, keyed by `(memory_size, num_writes)`.
+        cls.modules = {
+            (memory_size, num_writes): addressing.TemporalLinkage(
+                memory_size=memory_size, num_writes=num_writes
+            )
+            for memory_size, num_writes in [(4, 5), (4, 2), (6, 2), (3, 5)]
+        }
+
     def testModule(self):
         batch_size = 7
         memory_size = 4
         num_reads = 11
         num_writes = 5
-        module = addressing.TemporalLinkage(
-            memory_size=memory_size, num_writes=num_writes
-        )
+        module = self.modules[memory_size, num_writes]
 
         state = [
             #  link
-            np.zeros([batch_size, num_writes, memory_size, memory_size]),
+            tf.zeros([batch_size, num_writes, memory_size, memory_size], tf.float32),
             #  precedence_weights
-            np.zeros([batch_size, num_writes, memory_size]),
+            tf.zeros([batch_size, num_writes, memory_size], tf.float32),
         ]
 
         num_steps = 5
-        for i in range(num_steps):
-            write_weights = np.random.rand(batch_size, num_writes, memory_size)
-            write_weights /= write_weights.sum(2, keepdims=True) + 1
-
-            # Simulate (in final steps) link 0-->1 in head 0 and 3-->2 in head 1
-            if i == num_steps - 2:
-                write_weights[0, 0, :] = util.one_hot(memory_size, 0)
-                write_weights[0, 1, :] = util.one_hot(memory_size, 3)
-            elif i == num_steps - 1:
-                write_weights[0, 0, :] = util.one_hot(memory_size, 1)
-                write_weights[0, 1, :] = util.one_hot(memory_size, 2)
-
-            prev_link_in = state[addressing.LINK]
-            prev_precedence_weights_in = state[addressing.PRECEDENCE_WEIGHTS]
-            write_weights_in = write_weights
-
-            state = module(
-                write_weights_in,
-                [
-                    #  link
-                    prev_link_in,
-                    #  precedence_weights
-                    prev_precedence_weights_in,
-                ],
-            )
+        write_weights = self.rng.random(
+            (num_steps, batch_size, num_writes, memory_size), dtype=DTYPE
+        )
+        _normalize_rows(write_weights, cap=True)
+
+        # Simulate (in final steps) link 0-->1 in head 0 and 3-->2 in head 1
+        write_weights[-2, 0, 0, :] = util.one_hot(memory_size, 0)
+        write_weights[-2, 0, 1, :] = util.one_hot(memory_size, 3)
+        write_weights[-1, 0, 0, :] = util.one_hot(memory_size, 1)
+        write_weights[-1, 0, 1, :] = util.one_hot(memory_size, 2)
+
+        # Steps eagerly: tracing or compiling a scan costs more than running
+        # this small problem.
+        for step_write_weights in tf.constant(write_weights):
+            state = module(step_write_weights, state)
 
         result_link = state[addressing.LINK]
 
+        link = result_link.numpy()
+
         # link should be bounded in range [0, 1]
-        self.assertGreaterEqual(tf.math.reduce_min(result_link), 0)
-        self.assertLessEqual(tf.math.reduce_max(result_link), 1)
+        self.assertGreaterEqual(link.min(), 0)
+        self.assertLessEqual(link.max(), 1)
 
         # link diagonal should be zero
         self.assertAllEqual(
-            tf.linalg.diag_part(result_link),
+            np.diagonal(link, axis1=-2, axis2=-1),
             np.zeros([batch_size, num_writes, memory_size]),
         )
 
         # link rows and columns should sum to at most 1
-        self.assertLessEqual(
-            tf.math.reduce_max(tf.math.reduce_sum(result_link, axis=2)), 1
-        )
-        self.assertLessEqual(
-            tf.math.reduce_max(tf.math.reduce_sum(result_link, axis=3)), 1
-        )
+        self.assertLessEqual(link.sum(axis=2).max(), 1)
+        self.assertLessEqual(link.sum(axis=3).max(), 1)
 
         # records our transitions in batch 0: head 0: 0->1, and head 1: 3->2
-        self.assertAllEqual(result_link[0, 0, :, 0], util.one_hot(memory_size, 1))
-        self.assertAllEqual(result_link[0, 1, :, 3], util.one_hot(memory_size, 2))
+        self.assertOneHot(link[0, 0, :, 0], 1)
+        self.assertOneHot(link[0, 1, :, 3], 2)
 
         # Now test calculation of forward and backward read weights
-        prev_read_weights = np.random.rand(batch_size, num_reads, memory_size)
+        prev_read_weights = self.rng.random(
+            (batch_size, num_reads, memory_size), dtype=DTYPE
+        )
         prev_read_weights[0, 5, :] = util.one_hot(memory_size, 0)  # read 5, posn 0
         prev_read_weights[0, 6, :] = util.one_hot(memory_size, 2)  # read 6, posn 2
+        prev_read_weights = tf.constant(prev_read_weights)
         forward_read_weights = module.directional_read_weights(
-            tf.constant(result_link),
-            tf.constant(prev_read_weights, dtype=tf.float64),
-            forward=True,
+            result_link, prev_read_weights, forward=True
         )
         backward_read_weights = module.directional_read_weights(
-            tf.constant(result_link),
-            tf.constant(prev_read_weights, dtype=tf.float64),
-            forward=False,
+            result_link, prev_read_weights, forward=False
         )
 
         # Check directional weights calculated correctly.
-        self.assertAllEqual(
-            forward_read_weights[0, 5, 0, :],  # read=5, write=0
-            util.one_hot(memory_size, 1),
+        self.assertOneHot(forward_read_weights[0, 5, 0, :], 1)  # read=5, write=0
+        self.assertOneHot(backward_read_weights[0, 6, 1, :], 3)  # read=6, write=1
+
+    def testDirectionalReadWeightsBoth(self):
+        batch_size = 3
+        memory_size = 4
+        num_reads = 2
+        num_writes = 2
+        module = self.modules[memory_size, num_writes]
+
+        link = tf.constant(
+            self.rng.random(
+                (batch_size, num_writes, memory_size, memory_size), dtype=DTYPE
+            )
         )
-        self.assertAllEqual(
-            backward_read_weights[0, 6, 1, :],  # read=6, write=1
-            util.one_hot(memory_size, 3),
+        prev_read_weights = tf.constant(
+            self.rng.random((batch_size, num_reads, memory_size), dtype=DTYPE)
+        )
+
+        forward_weights, backward_weights = module.directional_read_weights_both(
+            link, prev_read_weights
+        )
+        self.assertAllClose(
+            forward_weights,
+            module.directional_read_weights(link, prev_read_weights, forward=True),
+        )
+        self.assertAllClose(
+            backward_weights,
+            module.directional_read_weights(link, prev_read_weights, forward=False),
         )
 
+    def testUnroll(self):
+        batch_size = 3
+        memory_size = 4
+        num_writes = 2
+        num_steps = 7
+        module = self.modules[memory_size, num_writes]
+
+        write_weights = self.rng.random(
+            (num_steps, batch_size, num_writes, memory_size), dtype=DTYPE
+        )
+        _normalize_rows(write_weights, cap=True)
+        write_weights = tf.constant(write_weights)
+        state = [
+            #  link
+            tf.zeros([batch_size, num_writes, memory_size, memory_size], tf.float32),
+            #  precedence_weights
+            tf.zeros([batch_size, num_writes, memory_size], tf.float32),
+        ]
+
+        link, precedence_weights = module.unroll(write_weights, state)
+
+        # The parallel scan should match stepping through the sequence.
+        for t in range(num_steps):
+            state = module(write_weights[t], state)
+            self.assertAllClose(link[t], state[addressing.LINK])
+            self.assertAllClose(
+                precedence_weights[t], state[addressing.PRECEDENCE_WEIGHTS]
+            )
+
+    def testSparseLink(self):
+        batch_size = 3
+        memory_size = 6
+        num_reads = 2
+        num_writes = 2
+        link_top_k = 3
+        module = addressing.TemporalLinkage(
+            memory_size=memory_size, num_writes=num_writes, link_top_k=link_top_k
+        )
+        dense_module = self.modules[memory_size, num_writes]
+
+        state = module.initial_state(batch_size)
+        for _ in range(4):
+            write_weights = self.rng.random(
+                (batch_size, num_writes, memory_size), dtype=DTYPE
+            )
+            _normalize_rows(write_weights, cap=True)
+            write_weights = tf.constant(write_weights)
+            prev_link = module.dense_link(state[addressing.LINK])
+            prev_precedence_weights = state[addressing.PRECEDENCE_WEIGHTS]
+            state = module(write_weights, state)
+
+            # Only the top entries of each row of the dense update are kept.
+            dense_state = dense_module(
+                write_weights, [prev_link, prev_precedence_weights]
+            )
+            link_values, link_indices = state[addressing.LINK]
+            self.assertEqual(link_indices.dtype, tf.int32)
+            self.assertEqual(
+                link_values.shape, [batch_size, num_writes, memory_size, link_top_k]
+            )
+            self.assertAllClose(
+                link_values,
+                tf.math.top_k(dense_state[addressing.LINK], k=link_top_k).values,
+            )
+
+        # Reading through the sparse link matches reading the dense link.
+        link = state[addressing.LINK]
+        dense_link = module.dense_link(link)
+        prev_read_weights = tf.constant(
+            self.rng.random((batch_size, num_reads, memory_size), dtype=DTYPE),
+            tf.float32,
+        )
+        for forward in [True, False]:
+            self.assertAllClose(
+                module.directional_read_weights(link, prev_read_weights, forward),
+                dense_module.directional_read_weights(
+                    dense_link, prev_read_weights, forward
+                ),
+            )
+
     def testPrecedenceWeights(self):
         batch_size = 7
         memory_size = 3
         num_writes = 5
-        module = addressing.TemporalLinkage(
-            memory_size=memory_size, num_writes=num_writes
-        )
+        module = self.modules[memory_size, num_writes]
 
-        prev_precedence_weights = np.random.rand(batch_size, num_writes, memory_size)
-        write_weights = np.random.rand(batch_size, num_writes, memory_size)
+        prev_precedence_weights = self.rng.random(
+            (batch_size, num_writes, memory_size), dtype=DTYPE
+        )
+        write_weights = self.rng.random(
+            (batch_size, num_writes, memory_size), dtype=DTYPE
+        )
 
         # These should sum to at most 1 for each write head in each batch.
-        write_weights /= write_weights.sum(2, keepdims=True) + 1
-        prev_precedence_weights /= prev_precedence_weights.sum(2, keepdims=True) + 1
+        _normalize_rows(write_weights, cap=True)
+        _normalize_rows(prev_precedence_weights, cap=True)
 
         write_weights[0, 1, :] = 0  # batch 0 head 1: no writing
         write_weights[1, 2, :] /= write_weights[1, 2, :].sum()  # b1 h2: all writing
@@ -261,23 +400,36 @@ class TemporalLinkageTest(tf.test.TestCase):
         self.assertAllClose(precedence_weights[1, 2, :], write_weights[1, 2, :])
 
 
-class FreenessTest(tf.test.TestCase):
+class FreenessTest(_AddressingTestMixin, tf.test.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super(FreenessTest, cls).setUpClass()
+        # Shares modules between tests, keyed by `memory_size`.
+        cls.modules = {
+            memory_size: addressing.Freeness(memory_size)
+            for memory_size in [5, 11, 13, 23]
+        }
+
     def testModule(self):
         batch_size = 5
         memory_size = 11
         num_reads = 3
         num_writes = 7
-        module = addressing.Freeness(memory_size)
+        module = self.modules[memory_size]
 
-        free_gate = np.random.rand(batch_size, num_reads)
+        free_gate = self.rng.random((batch_size, num_reads), dtype=DTYPE)
 
         # Produce read weights that sum to 1 for each batch and head.
-        prev_read_weights = np.random.rand(batch_size, num_reads, memory_size)
+        prev_read_weights = self.rng.random(
+            (batch_size, num_reads, memory_size), dtype=DTYPE
+        )
         prev_read_weights[1, :, 3] = 0  # no read at batch 1, position 3; see below
-        prev_read_weights /= prev_read_weights.sum(2, keepdims=True)
-        prev_write_weights = np.random.rand(batch_size, num_writes, memory_size)
-        prev_write_weights /= prev_write_weights.sum(2, keepdims=True)
-        prev_usage = np.random.rand(batch_size, memory_size)
+        _normalize_rows(prev_read_weights)
+        prev_write_weights = self.rng.random(
+            (batch_size, num_writes, memory_size), dtype=DTYPE
+        )
+        _normalize_rows(prev_write_weights)
+        prev_usage = self.rng.random((batch_size, memory_size), dtype=DTYPE)
 
         # Add some special values that allows us to test the behaviour:
         prev_write_weights[1, 2, 3] = 1  # full write in batch 1, head 2, position 3
@@ -294,23 +446,20 @@ class FreenessTest(tf.test.TestCase):
         usage = usage.numpy()
 
         # Check all usages are between 0 and 1.
-        self.assertGreaterEqual(usage.min(), 0)
-        self.assertLessEqual(usage.max(), 1)
-
-        # Check that the full write at batch 1, position 3 makes it fully used.
-        self.assertEqual(usage[1][3], 1)
+        self.assertAllInRange(usage, 0, 1)
 
-        # Check that the full free at batch 2, position 4 makes it fully free.
-        self.assertEqual(usage[2][4], 0)
+        # Check that the full write at batch 1, position 3 makes it fully used,
+        # and the full free at batch 2, position 4 makes it fully free.
+        self.assertAllEqual(usage[[1, 2], [3, 4]], [1, 0])
 
     def testWriteAllocationWeights(self):
         batch_size = 7
         memory_size = 23
         num_writes = 5
-        module = addressing.Freeness(memory_size)
+        module = self.modules[memory_size]
 
-        usage = np.random.rand(batch_size, memory_size)
-        write_gates = np.random.rand(batch_size, num_writes)
+        usage = self.rng.random((batch_size, memory_size), dtype=DTYPE)
+        write_gates = self.rng.random((batch_size, num_writes), dtype=DTYPE)
 
         # Turn off gates for heads 1 and 3 in batch 0. This doesn't scaling down the
         # weighting, but it means that the usage doesn't change, so we should get
@@ -348,40 +497,59 @@ class FreenessTest(tf.test.TestCase):
         )
 
         # Check the same / different allocation weight pairs as described above.
-        self.assertGreater(np.abs(weights[0, 0, :] - weights[0, 1, :]).max(), 0.1)
-        self.assertAllEqual(weights[0, 1, :], weights[0, 2, :])
-        self.assertGreater(np.abs(weights[0, 2, :] - weights[0, 3, :]).max(), 0.1)
-        self.assertAllEqual(weights[0, 3, :], weights[0, 4, :])
+        self.assertAllGreater(
+            np.abs(weights[0, [0, 2]] - weights[0, [1, 3]]).max(axis=1), 0.1
+        )
+        self.assertAllEqual(weights[0, [1, 3]], weights[0, [2, 4]])
 
-        self.assertAllClose(weights[1][0], util.one_hot(memory_size, 4), atol=1e-3)
-        self.assertAllClose(weights[1][1], util.one_hot(memory_size, 3), atol=1e-3)
+        self.assertOneHot(weights[1][0], 4, atol=1e-3)
+        self.assertOneHot(weights[1][1], 3, atol=1e-3)
 
-    def testWriteAllocationWeightsGradient(self):
+    def testWriteAllocationWeightsSingleWrite(self):
         batch_size = 7
+        memory_size = 23
+        num_writes = 3
+        module = self.modules[memory_size]
+
+        usage = tf.constant(self.rng.random((batch_size, memory_size), dtype=DTYPE))
+        write_gates = tf.constant(
+            self.rng.random((batch_size, num_writes), dtype=DTYPE)
+        )
+        weights = module.write_allocation_weights(usage, write_gates, num_writes)
+
+        # A single write head gets the allocation of the first of many heads.
+        single_weights = module.write_allocation_weights(
+            usage, write_gates[:, :1], num_writes=1
+        )
+        self.assertAllClose(single_weights, weights[:, :1])
+
+    def testWriteAllocationWeightsGradient(self):
+        batch_size = 2
         memory_size = 5
         num_writes = 3
-        module = addressing.Freeness(memory_size)
+        module = self.modules[memory_size]
 
-        usage = tf.constant(np.random.rand(batch_size, memory_size))
-        write_gates = tf.constant(np.random.rand(batch_size, num_writes))
+        usage = tf.constant(self.rng.random((batch_size, memory_size)))
+        write_gates = tf.constant(self.rng.random((batch_size, num_writes)))
         # weights = module.write_allocation_weights(usage, write_gates, num_writes)
 
+        # Compiled once, so that the perturbed evaluations reuse the trace.
+        @tf.function(jit_compile=True)
+        def write_allocation_weights(usage, write_gates):
+            return module.write_allocation_weights(usage, write_gates, num_writes)
+
         theoretical, numerical = tf.test.compute_gradient(
-            lambda usage, write_gates: module.write_allocation_weights(
-                usage, write_gates, num_writes
-            ),
-            [usage, write_gates],
-            delta=1e-5,
+            write_allocation_weights, [usage, write_gates], delta=1e-3
         )
         self.assertLess(
-            sum([tf.norm(numerical[i] - theoretical[i]) for i in range(2)]), 0.01
+            sum([tf.norm(numerical[i] - theoretical[i]) for i in range(2)]), 0.02
         )
 
     def testAllocation(self):
         batch_size = 7
         memory_size = 13
-        usage = np.random.rand(batch_size, memory_size)
-        module = addressing.Freeness(memory_size)
+        usage = self.rng.random((batch_size, memory_size), dtype=DTYPE)
+        module = self.modules[memory_size]
         allocation = module._allocation(tf.constant(usage))
 
         # 1. Test that max allocation goes to min usage, and vice versa.
@@ -391,14 +559,25 @@ class FreenessTest(tf.test.TestCase):
         # 2. Test that allocations sum to almost 1.
         self.assertAllClose(np.sum(allocation, axis=1), np.ones(batch_size), 0.01)
 
+        # 3. Test against the closed form, computed with one sort for the batch.
+        usage = addressing._EPSILON + (1 - addressing._EPSILON) * usage
+        indices = np.argsort(usage, axis=1)
+        sorted_usage = np.take_along_axis(usage, indices, axis=1)
+        prod_sorted_usage = np.cumprod(sorted_usage, axis=1) / sorted_usage
+        expected = np.empty_like(usage)
+        np.put_along_axis(
+            expected, indices, (1 - sorted_usage) * prod_sorted_usage, axis=1
+        )
+        self.assertAllClose(allocation, expected, atol=1e-5)
+
     def testAllocationGradient(self):
         batch_size = 1
         memory_size = 5
-        usage = tf.constant(np.random.rand(batch_size, memory_size))
-        module = addressing.Freeness(memory_size)
+        usage = tf.constant(self.rng.random((batch_size, memory_size)))
+        module = self.modules[memory_size]
         theoretical, numerical = tf.test.compute_gradient(
-            module._allocation, [usage], delta=1e-5
+            module._allocation, [usage], delta=1e-3
         )
         self.assertLess(
-            sum([tf.norm(numerical[i] - theoretical[i]) for i in range(1)]), 0.01
+            sum([tf.norm(numerical[i] - theoretical[i]) for i in range(1)]), 0.02
         )
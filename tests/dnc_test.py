@@ -19,6 +19,7 @@ from __future__ import division
 from __future__ import print_function
 
 import datetime
+import unittest
 import numpy as np
 import tensorflow as tf
 from tensorflow.python.framework import random_seed
@@ -102,3 +103,56 @@ class DNCCoreTest(tf.test.TestCase):
 
         grads, _ = tf.clip_by_global_norm(gradients, MAX_GRAD_NORM)
         optimizer.apply_gradients(zip(gradients, self.module.trainable_variables))
+
+    @unittest.skipIf(access.numba_step is None, "requires numba")
+    def testNumbaAccess(self):
+        access_config = {
+            "memory_size": MEMORY_SIZE,
+            "word_size": WORD_SIZE,
+            "num_reads": NUM_READ_HEADS,
+            "num_writes": NUM_WRITE_HEADS,
+            "numba": True,
+        }
+        module = dnc.DNC(
+            access_config, {"units": HIDDEN_SIZE}, OUTPUT_SIZE, BATCH_SIZE, CLIP_VALUE
+        )
+        inputs = tf.random.normal([TIME_STEPS, BATCH_SIZE, INPUT_SIZE], dtype=DTYPE)
+        initial_state = module.get_initial_state(batch_size=BATCH_SIZE)
+
+        # The Numba access step cannot be compiled with the rest of the core.
+        rnn = tf.keras.layers.RNN(cell=module, time_major=True, return_sequences=True)
+        outputs = rnn(inputs, initial_state=initial_state)
+        self.assertEqual(outputs.shape, [TIME_STEPS, BATCH_SIZE, OUTPUT_SIZE])
+
+        # It matches the compiled TensorFlow step of the same core.
+        reference = dnc.DNC(
+            dict(access_config, numba=False),
+            {"units": HIDDEN_SIZE},
+            OUTPUT_SIZE,
+            BATCH_SIZE,
+            CLIP_VALUE,
+        )
+        reference(inputs[0], initial_state)
+        for variable, value in zip(reference.variables, module.variables):
+            variable.assign(value)
+        output, _ = module(inputs[0], initial_state)
+        expected, _ = reference(inputs[0], initial_state)
+        self.assertAllClose(output, expected, atol=1e-5, rtol=1e-5)
+
+    def testQuantizedMemoryInitialState(self):
+        access_config = {
+            "memory_size": MEMORY_SIZE,
+            "word_size": WORD_SIZE,
+            "num_reads": NUM_READ_HEADS,
+            "num_writes": NUM_WRITE_HEADS,
+            "quantize_memory": True,
+        }
+        module = dnc.DNC(
+            access_config, {"units": HIDDEN_SIZE}, OUTPUT_SIZE, BATCH_SIZE, CLIP_VALUE
+        )
+        initial_state = module.get_initial_state(batch_size=BATCH_SIZE)
+
+        access_state = initial_state[dnc.ACCESS_STATE]
+        self.assertEqual(access_state[access.MEMORY].dtype, tf.int8)
+        self.assertEqual(access_state[access.MEMORY_SCALE].dtype, DTYPE)
+        self.assertEqual(initial_state[dnc.ACCESS_OUTPUT].dtype, DTYPE)
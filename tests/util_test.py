@@ -57,6 +57,75 @@ class BatchGather(tf.test.TestCase):
         self.assertAllEqual(target, result)
 
 
+class BatchFlatten(tf.test.TestCase):
+    def test(self):
+        values = np.random.rand(3, 4, 5)
+        result = util.batch_flatten(tf.constant(values))
+        self.assertEqual(result.shape, [3, 20])
+        self.assertAllEqual(result, values.reshape(3, 20))
+
+    def testDynamicShape(self):
+        values = np.random.rand(3, 4, 5)
+        batch_flatten = tf.function(
+            util.batch_flatten,
+            input_signature=[tf.TensorSpec([None, None, 5], tf.float64)],
+        )
+        self.assertAllEqual(batch_flatten(values), values.reshape(3, 20))
+
+
+class OneHot(tf.test.TestCase):
+    def test(self):
+        self.assertAllEqual(util.one_hot(4, 2), [0, 0, 1, 0])
+        self.assertAllEqual(util.one_hot(3, [2, 0]), [[0, 0, 1], [1, 0, 0]])
+
+
+class ReduceProd(tf.test.TestCase):
+    def test(self):
+        x = np.random.rand(3, 4, 5)
+        x[0, 1, 2] = 0  # a zero must not break the gradient
+        x = tf.constant(x)
+
+        for axis in [0, 1, -1]:
+            with tf.GradientTape(persistent=True) as tape:
+                tape.watch(x)
+                result = util.reduce_prod(x, axis)
+                expected = tf.math.reduce_prod(x, axis=axis)
+
+            self.assertAllClose(result, expected)
+            self.assertAllClose(tape.gradient(result, x), tape.gradient(expected, x))
+
+
+class LinearRecurrenceScan(tf.test.TestCase):
+    def test(self):
+        num_steps = 5
+        a = np.random.rand(num_steps, 3)
+        b = np.random.rand(num_steps, 3)
+        initial = np.random.rand(3)
+
+        result = util.linear_recurrence_scan(
+            tf.constant(a), tf.constant(b), tf.constant(initial)
+        )
+
+        x = initial
+        for t in range(num_steps):
+            x = a[t] * x + b[t]
+            self.assertAllClose(result[t], x)
+
+    def testDynamicNumSteps(self):
+        a = np.random.rand(5, 3)
+        b = np.random.rand(5, 3)
+        initial = np.random.rand(3)
+        spec = tf.TensorSpec([None, 3], tf.float64)
+        scan = tf.function(
+            util.linear_recurrence_scan,
+            input_signature=[spec, spec, tf.TensorSpec([3], tf.float64)],
+        )
+
+        self.assertAllClose(
+            scan(a, b, initial), util.linear_recurrence_scan(a, b, initial)
+        )
+
+
 @pytest.mark.parametrize(
     "batch_size, state_size, initial_state",
     [
@@ -84,3 +153,27 @@ def test_initial_state_from_state_size(batch_size, state_size, initial_state):
     assert str(initial_state) == str(
         util.initial_state_from_state_size(state_size, batch_size, tf.float32)
     )
+
+
+def test_initial_state_from_state_size_nested_dtype():
+    state_size = [2, [tf.TensorShape([1, 3])]]
+    initial_state = util.initial_state_from_state_size(
+        state_size, 2, [tf.float32, [tf.int32]]
+    )
+    assert initial_state[0].dtype == tf.float32
+    assert initial_state[1][0].dtype == tf.int32
+
+
+def test_cached_initial_state():
+    cache = {}
+    state_size = [2, [tf.TensorShape([1, 3])]]
+    initial_state = util.cached_initial_state(cache, state_size, 2, tf.float32)
+    assert str(initial_state) == str(
+        util.initial_state_from_state_size(state_size, 2, tf.float32)
+    )
+
+    # The same zero tensors are reused for the same batch size and dtype.
+    cached_state = util.cached_initial_state(cache, state_size, 2, tf.float32)
+    assert cached_state[0] is initial_state[0]
+    assert cached_state[1][0] is initial_state[1][0]
+    assert len(cache) == 1